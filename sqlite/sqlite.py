@@ -1,5 +1,9 @@
 #!/usr/bin/python3
+import os
+import re
 import sqlite3
+import threading
+from functools import lru_cache
 from sqlite.sqlitestmt import SQLiteStmt
 from sqlite.sqliteexception import SQLiteException
 
@@ -29,19 +33,54 @@ class SQLite(SQLiteException):
     insert_id = 0                              # Returns the auto generated id used in the last query
     server_info = sqlite3.sqlite_version_info  # Returns the version of the SQLite as a tuple
     server_version = sqlite3.sqlite_version    # Returns the version of the SQLite as a string
+    flush_error = ""                           # Returns a string description of the last failed periodic write-back
 
     _options = dict()  # Save options when called SQLite.init()
 
-    def __init__(self, file=''):
+    _file = ''             # DB file the in-memory copy is written back to (in_memory mode only)
+    _flush_interval = None  # seconds between two write-backs, None means write back only at close()
+    _flush_timer = None     # threading.Timer scheduling the next write-back
+    _flushed_state = None   # self._write_state() at the last write-back
+
+    _results = list()  # results of SQLite.multi_query() not reached by SQLite.next_result() yet
+    _result = None     # (description, rows) of the current result of SQLite.multi_query()
+
+    def __init__(self, file='', in_memory=False, flush_interval=None):
         """
         Open a new connection to the sqlite3
+
+        If in_memory is True, the whole DB file is copied into a :memory: database
+        using the SQLite backup API, so reads never touch a cold page-cache.
+        Modifications are written back to the file (again with the backup API)
+        every flush_interval seconds, on SQLite.flush() and on SQLite.close().
+
+        Crash-safety: each write-back is atomic (the snapshot is written to file.tmp
+        which then replaces the file), but every modification made after the last
+        write-back is lost if the process dies before the next one. Only committed
+        modifications are written back: a write-back is skipped while a transaction
+        is open and SQLite.close() discards (rolls back) an open transaction first.
+        Statements are blocked only while the snapshot is copied in memory, not
+        while it is written to the disk. A failed periodic write-back does not set
+        SQLite.error but SQLite.flush_error, and it is retried at the next one.
+        NOTE: in_memory requires Python 3.7+ (sqlite3.Connection.backup)
         :param file: SQLite DB file or :memory:
         :type file: str
+        :param in_memory: load the DB file into memory and write it back lazily
+        :type in_memory: bool
+        :param flush_interval: seconds between two write-backs, None means only at close()
+        :type flush_interval: int or float or None
         :rtype: None
         """
+        # serializes the statements with the write-back timer thread
+        self._lock = threading.RLock()
+        # serializes the write-backs, always taken before self._lock
+        self._flush_lock = threading.RLock()
         if file != '':
             try:
-                self._conn = sqlite3.connect(file)
+                if in_memory and file != ':memory:':
+                    self._open_in_memory(file, flush_interval)
+                else:
+                    self._conn = sqlite3.connect(file)
                 self._conn.isolation_level = None  # auto-commit is on
             except:
                 import sys
@@ -92,7 +131,8 @@ class SQLite(SQLiteException):
         :rtype: bool
         """
         try:
-            self._conn.cursor().execute("BEGIN")
+            with self._lock:
+                self._conn.cursor().execute("BEGIN")
             return True
         except:
             self._handle_error()
@@ -163,6 +203,162 @@ class SQLite(SQLiteException):
             self._handle_error()
             return False
 
+    def create_function(self, name, num_params, func, deterministic=False, cache_size=0):
+        """
+        Creates a user-defined function that can be used from within SQL statements
+        NOTE: deterministic requires Python 3.8+ and SQLite 3.8.3+
+        :param name: name of the SQL function
+        :type name: str
+        :param num_params: number of arguments the function accepts, -1 for any number
+        :type num_params: int
+        :param func: a Python callable
+        :param deterministic: whether the function always returns the same result for the same
+            arguments, which lets SQLite factor it out of loops and use it in indexes
+        :type deterministic: bool
+        :param cache_size: memoize this many results of a pure function, 0 disables it, None means unbounded
+        :type cache_size: int or None
+        :rtype: bool
+        """
+        try:
+            if cache_size != 0:
+                # typed, so that SQL 1 and 1.0 are cached apart
+                func = lru_cache(maxsize=cache_size, typed=True)(func)
+            if deterministic:
+                self._conn.create_function(name, num_params, func, deterministic=True)
+            else:
+                self._conn.create_function(name, num_params, func)
+            return True
+        except:
+            self._handle_error()
+            return False
+
+    def create_aggregate(self, name, num_params, aggregate, batch=False):
+        """
+        Creates a user-defined aggregate function
+
+        If batch is True, aggregate is a callable receiving one list per argument
+        holding every value of the group, and it is called once per group instead
+        of once per row, e.g. create_aggregate('median', 1, statistics.median, True).
+        Like the built-in aggregates, it gives NULL for an empty group without calling
+        the callable. num_params must not be -1 in this mode.
+        :param name: name of the SQL aggregate function
+        :type name: str
+        :param num_params: number of arguments the aggregate accepts, -1 for any number
+        :type num_params: int
+        :param aggregate: a class with step() and finalize() methods, or a callable if batch is True
+        :param batch: collect the values and compute the aggregate at finalize
+        :type batch: bool
+        :rtype: bool
+        """
+        try:
+            if batch:
+                if num_params < 0:
+                    raise ValueError("batch aggregates need a fixed number of arguments")
+                aggregate = self._batch_aggregate(aggregate, num_params)
+            self._conn.create_aggregate(name, num_params, aggregate)
+            return True
+        except:
+            self._handle_error()
+            return False
+
+    def multi_query(self, query):
+        """
+        Performs one or more queries, separated by semicolon, on the database
+
+        The whole script is executed here, inside one transaction which is committed
+        after the last query or rolled back on the first error. No transaction is added
+        if one is already open, if the script controls its own transactions (BEGIN,
+        COMMIT, SAVEPOINT...) or if it contains a statement that cannot run inside a
+        transaction (VACUUM, PRAGMA journal_mode, PRAGMA foreign_keys).
+
+        NOTE: every result set is fully fetched and kept in memory when multi_query()
+        returns, since the transaction is committed before returning and the later
+        queries may modify the rows of the earlier ones. Results are not streamed.
+        :param query: SQL queries separated by semicolon
+        :type query: str
+        :rtype: bool
+        """
+        try:
+            self._results = list()
+            self._result = None
+            statements = self._split_statements(query)
+            if len(statements) == 0:
+                return False
+            with self._lock:
+                was_in_transaction = self._conn.in_transaction
+                own_transaction = not was_in_transaction and not any(
+                    self._is_transaction_control(statement) for statement in statements)
+                try:
+                    if own_transaction:
+                        self._conn.cursor().execute("BEGIN")
+                    results = list()
+                    for statement in statements:
+                        cursor = self._conn.cursor()
+                        cursor.execute(statement)
+                        # rows are fetched right away as the next statements may modify them
+                        rows = cursor.fetchall() if cursor.description else list()
+                        results.append((cursor.description, rows, cursor.rowcount, cursor.lastrowid))
+                    if own_transaction:
+                        self._conn.commit()
+                except:
+                    if not was_in_transaction and self._conn.in_transaction:
+                        self._conn.rollback()
+                    raise
+            self._results = results
+            return self.next_result()
+        except:
+            self._handle_error()
+            return False
+
+    def more_results(self):
+        """
+        Checks if there are any more query results from a multi query
+        :rtype: bool
+        """
+        return len(self._results) > 0
+
+    def next_result(self):
+        """
+        Prepares next result from SQLite.multi_query()
+        :rtype: bool
+        """
+        try:
+            if not self.more_results():
+                self._result = None
+                return False
+            description, rows, rowcount, lastrowid = self._results.pop(0)
+            self._result = (description, rows)
+            # self.affected_rows is either cursor.rowcount or 0. I don't like -1.
+            self.affected_rows = rowcount if rowcount != -1 else 0
+            self.field_count = len(description) if description else 0
+            if lastrowid:
+                self.insert_id = lastrowid
+            return True
+        except:
+            self._handle_error()
+            return False
+
+    def store_result(self):
+        """
+        Transfers the result set of the current query of SQLite.multi_query()
+        :returns: SQLiteStmt with the stored result (num_rows may be 0), or False if the query
+            has no result set (e.g. INSERT) or its result has already been stored
+        :rtype: SQLiteStmt or bool
+        """
+        try:
+            if self._result is None or self._result[0] is None:
+                return False
+            stmt = SQLiteStmt(self._conn, '', self._lock)
+            stmt._fetched_rows = self._result[1]
+            stmt.num_rows = len(stmt._fetched_rows)
+            stmt.field_count = self.field_count
+            stmt.store_result()
+            self._result = None
+            return stmt
+        except:
+            self._handle_error()
+            return False
+
     def query(self, query):  # todo: This  method should return SQLiteResult
         """
         Performs a query on the database
@@ -182,7 +378,8 @@ class SQLite(SQLiteException):
         :rtype: bool
         """
         try:
-            self._conn.rollback()
+            with self._lock:
+                self._conn.rollback()
             return True
         except:
             self._handle_error()
@@ -209,7 +406,8 @@ class SQLite(SQLiteException):
         :rtype: bool
         """
         try:
-            self._conn.isolation_level = mode
+            with self._lock:
+                self._conn.isolation_level = mode
             return True if not mode else False
         except:
             self._handle_error()
@@ -221,7 +419,23 @@ class SQLite(SQLiteException):
         :rtype: bool
         """
         try:
-            self._conn.commit()
+            with self._lock:
+                self._conn.commit()
+            return True
+        except:
+            self._handle_error()
+            return False
+
+    def flush(self):
+        """
+        Writes the in-memory database back to its DB file
+        NOTE: it does nothing unless the connection was opened with in_memory=True.
+        Nothing is written while a transaction is open, so that only committed
+        modifications ever reach the DB file
+        :rtype: bool
+        """
+        try:
+            self._flush()
             return True
         except:
             self._handle_error()
@@ -230,10 +444,22 @@ class SQLite(SQLiteException):
     def close(self):
         """
         Closes a previously opened database connection
+        NOTE: in in_memory mode, an open transaction is rolled back and the
+        committed modifications are written back first
         :rtype: bool
         """
         try:
-            self._conn.close()
+            with self._flush_lock, self._lock:
+                if self._file != '':
+                    if self._conn.in_transaction:
+                        self._conn.rollback()
+                    if not self.flush():
+                        return False
+                    self._file = ''
+                    if self._flush_timer is not None:
+                        self._flush_timer.cancel()
+                        self._flush_timer = None
+                self._conn.close()
             return True
         except:
             self._handle_error()
@@ -251,13 +477,156 @@ class SQLite(SQLiteException):
             self._handle_error()
             return False
 
+    def _open_in_memory(self, file, flush_interval):
+        """
+        Loads the DB file into a :memory: database and schedules the write-back
+        :rtype: None
+        """
+        # the write-back timer runs in its own thread
+        self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+        disk = sqlite3.connect(file)
+        try:
+            disk.backup(self._conn)
+        finally:
+            disk.close()
+        self._file = file
+        self._flush_interval = flush_interval
+        self._flushed_state = self._write_state()
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        """
+        Schedules the next periodic write-back, if any
+        :rtype: None
+        """
+        if self._flush_interval:
+            self._flush_timer = threading.Timer(self._flush_interval, self._periodic_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _periodic_flush(self):
+        """
+        Writes back the in-memory database and schedules the next write-back
+        :rtype: None
+        """
+        try:
+            self._flush()
+        except:
+            import sys
+            self.flush_error = sys.exc_info()[1]
+        with self._lock:
+            if self._file != '':
+                self._schedule_flush()
+
+    def _flush(self):
+        """
+        Copies the in-memory database into a snapshot and writes the snapshot to the DB file
+        NOTE: only the in-memory copy blocks the statements
+        :rtype: None
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._file == '' or self._conn.in_transaction:
+                    return
+                state = self._write_state()
+                if state == self._flushed_state:
+                    return
+                snapshot = sqlite3.connect(':memory:')
+                self._conn.backup(snapshot)
+            try:
+                temp = self._file + '.tmp'
+                disk = sqlite3.connect(temp)
+                try:
+                    snapshot.backup(disk)
+                finally:
+                    disk.close()
+                os.replace(temp, self._file)
+            finally:
+                snapshot.close()
+            self._flushed_state = state
+
+    def _write_state(self):
+        """
+        Returns what changes when the in-memory database is modified
+        NOTE: total_changes only counts rows, schema_version catches DDL and
+        user_version is not covered by either of them
+        :rtype: tuple
+        """
+        cursor = self._conn.cursor()
+        schema_version = cursor.execute("PRAGMA schema_version").fetchone()[0]
+        user_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        return self._conn.total_changes, schema_version, user_version
+
+    @staticmethod
+    def _batch_aggregate(func, num_params):
+        """
+        Wraps a callable taking one list per argument into an aggregate class
+        NOTE: sqlite3 does not call finalize() for an empty group, so self._columns are never empty there
+        :rtype: type
+        """
+        class BatchAggregate:
+            def __init__(self):
+                self._columns = [list() for _ in range(num_params)]
+
+            def step(self, *args):
+                for column, value in zip(self._columns, args):
+                    column.append(value)
+
+            def finalize(self):
+                return func(*self._columns)
+
+        return BatchAggregate
+
+    @staticmethod
+    def _split_statements(query):
+        """
+        Splits an SQL script into complete statements
+        :param query: SQL queries separated by semicolon
+        :type query: str
+        :rtype: list
+        """
+        statements = list()
+        statement = ''
+        for part in query.split(';'):
+            statement += part + ';'
+            if sqlite3.complete_statement(statement):
+                if SQLite._strip_comments(statement) != '':
+                    statements.append(statement.strip())
+                statement = ''
+        if SQLite._strip_comments(statement) != '':
+            statements.append(statement.strip())
+        return statements
+
+    @staticmethod
+    def _strip_comments(statement):
+        """
+        Removes the comments, semicolons and surrounding whitespaces of a statement
+        :param statement: SQL query
+        :type statement: str
+        :rtype: str
+        """
+        return re.sub(r'--[^\n]*|/\*.*?(\*/|$)', ' ', statement, flags=re.S).strip(' \t\r\n;')
+
+    @staticmethod
+    def _is_transaction_control(statement):
+        """
+        Checks if a statement begins, ends or nests a transaction, or must run outside of one
+        :param statement: SQL query
+        :type statement: str
+        :rtype: bool
+        """
+        words = re.split(r'[\s=(]+', SQLite._strip_comments(statement).upper())
+        if words[0] == 'PRAGMA':
+            return len(words) > 1 and words[1].split('.')[-1] in ('JOURNAL_MODE', 'FOREIGN_KEYS')
+        return words[0] in ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'VACUUM')
+
     def _query(self, query=''):
         """
         Switch to SQLiteStmt to execute and show result
         :rtype: SQLiteStmt or bool
         """
         try:
-            return SQLiteStmt(self._conn, query)
+            return SQLiteStmt(self._conn, query, self._lock)
         except:
             self._handle_error()
             return False
@@ -1,4 +1,5 @@
 #!/usr/bin/python3
+import threading
 from sqlite.sqliteexception import SQLiteException
 
 __title__ = 'SQLiteStmt'
@@ -30,17 +31,20 @@ class SQLiteStmt(SQLiteException):
     _temp_index = 0         # temporary index for self.bind_result()
     _bind_args = tuple()    # tuple arguments of self.bind_result()
 
-    def __init__(self, conn, query=''):
+    def __init__(self, conn, query='', lock=None):
         """
         Constructs a new SQLiteStmt object
         :param conn: Connect object
         :type conn: sqlite3.connect
         :param query: SQL query
         :type query: str
+        :param lock: lock of the SQLite object that owns conn
+        :type lock: threading.RLock or None
         :rtype: None
         """
         try:
             self._conn = conn
+            self._lock = lock if lock is not None else threading.RLock()
             self._query = query
             self.param_count = query.count('?')
         except:
@@ -94,11 +98,12 @@ class SQLiteStmt(SQLiteException):
         :rtype: bool
         """
         try:
-            cursor = self._conn.cursor()
-            cursor.execute(self._query, self._params)
-            if self._conn.isolation_level:
-                self._conn.commit()
-            rows = cursor.fetchall()  # fetch all the rows
+            with self._lock:
+                cursor = self._conn.cursor()
+                cursor.execute(self._query, self._params)
+                if self._conn.isolation_level:
+                    self._conn.commit()
+                rows = cursor.fetchall()  # fetch all the rows
 
             # self.affected_rows is either cursor.rowcount or 0. I don't like -1.
             self.affected_rows = cursor.rowcount if cursor.rowcount != -1 else 0
@@ -110,7 +115,8 @@ class SQLiteStmt(SQLiteException):
             return True
         except:
             self._handle_error()
-            self._conn.rollback()
+            with self._lock:
+                self._conn.rollback()
             return False
 
     def store_result(self):
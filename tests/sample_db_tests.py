@@ -2,6 +2,9 @@
 
 from sqlite import SQLite
 from datetime import datetime
+import os
+import sys
+import tempfile
 # notice: you don't need to import sqlite3 module
 
 __title__ = 'Sample Database Test'
@@ -130,6 +133,152 @@ stmt.close()
 print("Closing the Database connection...")
 sqlite.close()
 print("Connection closed.")
+
+db_file = os.path.join(tempfile.mkdtemp(), "sample.db")
+
+# in_memory needs sqlite3.Connection.backup (Python 3.7+)
+if sys.version_info >= (3, 7):
+    print("Loading a Database file into memory...", end=' ')
+    sqlite = SQLite(db_file)
+    stmt = sqlite.prepare("CREATE TABLE old (ID integer)")
+    stmt.execute()
+    stmt.close()
+    sqlite.close()
+    sqlite = SQLite(db_file, in_memory=True, flush_interval=60)
+    print("...")
+    if sqlite.connect_error: raise sqlite.connect_errno(sqlite.connect_error)
+    else: print("Loaded into memory.")
+
+    print("Changing only the schema...", end=' ')
+    for query in ("CREATE TABLE new (ID integer)", "DROP TABLE old", "CREATE INDEX new_id ON new (ID)",
+                  "PRAGMA user_version = 7"):
+        stmt = sqlite.prepare(query)
+        stmt.execute()
+        if stmt.error: raise stmt.errno(stmt.error)
+        stmt.close()
+    print("...")
+    if not sqlite.close(): raise sqlite.errno(sqlite.error)
+    print("Written back to the file.")
+
+    print("Checking the Database file...", end=' ')
+    sqlite = SQLite(db_file)
+    stmt = sqlite.prepare("SELECT name FROM sqlite_master ORDER BY name")
+    stmt.execute()
+    print("...")
+    stmt.store_result()
+    names = []
+    name = []
+    for i in range(0, stmt.num_rows):
+        stmt.bind_result(name)
+        stmt.fetch()
+        names.append(name[0])
+    if names != ["new", "new_id"]: raise AssertionError("schema not written back: {}".format(names))
+    stmt.close()
+    stmt = sqlite.prepare("PRAGMA user_version")
+    stmt.execute()
+    stmt.store_result()
+    version = []
+    stmt.bind_result(version)
+    stmt.fetch()
+    if version[0] != 7: raise AssertionError("user_version not written back: {}".format(version[0]))
+    stmt.close()
+    sqlite.close()
+    print("Schema and user_version were written back.")
+else:
+    print("Skipped loading a Database file into memory (needs Python 3.7+).")
+
+print("Running a migration script...", end=' ')
+sqlite = SQLite(db_file)
+sqlite.multi_query("""CREATE TABLE cast (ID integer PRIMARY KEY, Name text);
+        INSERT INTO cast (Name) VALUES ('Ian McKellen'), ('Viggo Mortensen');
+        SELECT Name FROM cast ORDER BY ID;
+        INSERT INTO cast (Name) VALUES ('David Tennant');  -- last statement
+        """)
+print("...")
+if sqlite.error: raise sqlite.errno(sqlite.error)
+results = 0
+while True:
+    results += 1
+    stmt = sqlite.store_result()
+    if stmt:
+        name = []
+        for i in range(0, stmt.num_rows):
+            stmt.bind_result(name)
+            stmt.fetch()
+            print("Selected:", name[0])
+        stmt.close()
+    if not sqlite.next_result(): break
+if results != 4: raise AssertionError("expected 4 results, got {}".format(results))
+sqlite.close()
+sqlite = SQLite(db_file)
+stmt = sqlite.prepare("SELECT count(*) FROM cast")
+stmt.execute()
+stmt.store_result()
+count = []
+stmt.bind_result(count)
+stmt.fetch()
+if count[0] != 3: raise AssertionError("migration not committed: {} rows".format(count[0]))
+stmt.close()
+sqlite.close()
+print("Migration committed.")
+
+# deterministic functions need Python 3.8+
+if sys.version_info >= (3, 8):
+    import statistics
+    print("Registering user-defined functions...", end=' ')
+    sqlite = SQLite(":memory:")
+    squared = []
+    def square(x):
+        squared.append(x)
+        return x * x
+    sqlite.create_function("square", 1, square, deterministic=True, cache_size=128)
+    sqlite.create_aggregate("median", 1, statistics.median, batch=True)
+    print("...")
+    if sqlite.error: raise sqlite.errno(sqlite.error)
+    print("Functions registered.")
+
+    print("Using them in an index and a GROUP BY...", end=' ')
+    sqlite.multi_query("""CREATE TABLE score (Team text, Value integer);
+            INSERT INTO score VALUES ('a', 1), ('a', 2), ('a', 9), ('b', 3), ('b', 3), ('b', 4);
+            CREATE INDEX score_square ON score (square(Value))""")
+    if sqlite.error: raise sqlite.errno(sqlite.error)
+    stmt = sqlite.prepare("SELECT Team, median(Value) FROM score WHERE square(Value) > 1 GROUP BY Team ORDER BY Team")
+    stmt.execute()
+    print("...")
+    if stmt.error: raise stmt.errno(stmt.error)
+    stmt.store_result()
+    team = []
+    median = []
+    medians = []
+    for i in range(0, stmt.num_rows):
+        stmt.bind_result(team, median)
+        stmt.fetch()
+        medians.append((team[0], median[0]))
+    if medians != [("a", 5.5), ("b", 3)]: raise AssertionError("unexpected medians: {}".format(medians))
+    if len(squared) != 5: raise AssertionError("square() called {} times".format(len(squared)))
+    stmt.close()
+    print("Medians:", medians)
+
+    print("Caching a function of an INTEGER and a REAL...", end=' ')
+    sqlite.create_function("show", 2, lambda x, y: repr(x) + repr(y), cache_size=16)
+    stmt = sqlite.prepare("SELECT show(1, 'a'), show(1.0, 'a')")
+    stmt.execute()
+    print("...")
+    stmt.store_result()
+    shown_integer = []
+    shown_real = []
+    stmt.bind_result(shown_integer, shown_real)
+    stmt.fetch()
+    if (shown_integer[0], shown_real[0]) != ("1'a'", "1.0'a'"):
+        raise AssertionError("1 and 1.0 share a cache entry: {} {}".format(shown_integer[0], shown_real[0]))
+    stmt.close()
+    print("1 and 1.0 are cached apart.")
+    if sqlite.create_aggregate("median_any", -1, statistics.median, batch=True):
+        raise AssertionError("batch aggregate accepted any number of arguments")
+    sqlite.close()
+else:
+    print("Skipped user-defined functions (needs Python 3.8+).")
+
 print("Program ends at:", datetime.now())
 print("Execution time:", datetime.now() - began)
 